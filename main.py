@@ -1,12 +1,15 @@
 import os
+import html
 import logging
-import asyncio
-from datetime import datetime, date, time, timedelta
-import pytz
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, date, time
+from time import monotonic
+from zoneinfo import ZoneInfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 # Changed scheduler import to AsyncIOScheduler
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import AIORateLimiter, Application, CommandHandler, MessageHandler, filters, ContextTypes
 from telegram import Update
 from apscheduler.schedulers.asyncio import AsyncIOScheduler # Changed from BackgroundScheduler
 
@@ -37,8 +40,29 @@ WEBHOOK_PATH = "/"
 # global app reference used by scheduled jobs to send messages
 telegram_bot_app = None
 
+# global DB connection pool (opened once in post_init, on the bot's event loop)
+_POOL = None
+
+# global job scheduler (started in post_init, on the bot's event loop)
+_SCHEDULER = None
+
+# In-process cache for get_all_members() (busted on every write).
+# "gen" is bumped on every invalidation so a read that raced a write doesn't store stale rows.
+_MEMBERS_CACHE = {"data": None, "ts": 0.0, "limit": None, "gen": 0}
+_CACHE_TTL = 30  # seconds
+
+# user_id -> (date, (points, streak)) for members already marked Completed on that date
+_COMPLETED_TODAY = {}
+
+# Proof caption check: same phrases as before ('today target complete[d]', 'target completed'), one scan
+_DONE_RE = re.compile(r"today target complete|target completed", re.IGNORECASE)
+
 # Timezone
-IST = pytz.timezone("Asia/Kolkata")
+IST = ZoneInfo("Asia/Kolkata")
+
+# Submission windows (IST, inclusive)
+_MORNING = (time(5, 0), time(9, 0))
+_NIGHT = (time(21, 0), time(23, 0))
 
 # ------------------------
 # 2. Logging
@@ -51,105 +75,126 @@ logging.basicConfig(
 # ------------------------
 # 3. Database helpers
 # ------------------------
-def get_db_connection():
-    """Return a new DB connection or None on failure."""
+async def init_db_pool():
+    """Open the shared async connection pool. Returns True on success."""
+    global _POOL
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
+        # prepare_threshold: hot per-user SELECT/UPDATE become server-side prepared after 5 runs
+        _POOL = AsyncConnectionPool(
+            DATABASE_URL, min_size=2, max_size=10,
+            kwargs={"prepare_threshold": 5}, open=False
+        )
+        await _POOL.open(wait=True)
+        return True
     except Exception as e:
-        logging.error(f"DB connect error: {e}")
-        return None
+        logging.error(f"DB pool init error: {e}")
+        return False
 
-def setup_database():
-    """Create members table and add columns if missing."""
-    conn = get_db_connection()
-    if conn is None:
-        logging.error("Cannot setup DB: connection failed.")
-        return
+async def close_db_pool():
+    """Close the shared pool on shutdown."""
+    if _POOL is not None:
+        await _POOL.close()
+
+async def setup_database():
+    """Create members table (and its indexes) if missing."""
     try:
-        cur = conn.cursor()
-        # Create table with columns for points, streak and last_completed_date
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS members (
-                user_id BIGINT PRIMARY KEY,
-                username TEXT,
-                submission_status TEXT,
-                target_count INT DEFAULT 0,
-                points INT DEFAULT 0,
-                streak INT DEFAULT 0,
-                last_completed_date DATE,
-                last_updated TIMESTAMP
-            );
-        """)
-        conn.commit()
+        async with _POOL.connection() as conn:
+            async with conn.cursor() as cur:
+                # Create table with columns for points, streak and last_completed_date
+                await cur.execute("""
+                    CREATE TABLE IF NOT EXISTS members (
+                        user_id BIGINT PRIMARY KEY,
+                        username TEXT,
+                        submission_status TEXT,
+                        target_count INT DEFAULT 0,
+                        points INT DEFAULT 0,
+                        streak INT DEFAULT 0,
+                        last_completed_date DATE,
+                        last_updated TIMESTAMP
+                    );
+                """)
+                # Leaderboard order (matches get_all_members ORDER BY)
+                await cur.execute("""
+                    CREATE INDEX IF NOT EXISTS members_leaderboard_idx
+                    ON members (points DESC NULLS LAST, streak DESC NULLS LAST, username ASC);
+                """)
+                # No index on last_completed_date: the nightly IS DISTINCT FROM filter can't use
+                # a btree index, and it would only add write cost to every completion.
         logging.info("DB setup complete (members table ensured).")
     except Exception as e:
         logging.error(f"Error in setup_database: {e}")
-    finally:
-        conn.close()
+
+def invalidate_members_cache():
+    """Drop the cached leaderboard so the next get_all_members() hits the DB."""
+    _MEMBERS_CACHE["ts"] = 0.0
+    _MEMBERS_CACHE["gen"] += 1
+
+@asynccontextmanager
+async def _connection(conn=None):
+    """
+    Reuse the caller's connection (and transaction) if given, else check one out of the pool.
+    add_member() and update_submission_status() take conn=... and open it through here.
+    """
+    if conn is not None:
+        yield conn
+    else:
+        async with _POOL.connection() as pooled:
+            yield pooled
+
+@asynccontextmanager
+async def _handler_tx():
+    """
+    One pooled connection / one transaction for a handler's multi-step DB work.
+    Pass the yielded conn to the member helpers via conn=...; commits once on exit.
+    Checkout (PoolTimeout) and COMMIT errors propagate, so callers must catch them.
+    """
+    async with _POOL.connection() as conn:
+        yield conn
+    # helpers bust the cache before this commit, so bust again once the writes are visible
+    invalidate_members_cache()
 
 # ------------------------
 # 4. Member operations
 # ------------------------
-def add_member(user_id: int, username: str):
+async def add_member(user_id: int, username: str, conn=None):
     """Add or update basic member row (keeps existing points/streak)."""
-    conn = get_db_connection()
-    if conn is None:
-        return False
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO members (user_id, username, submission_status, last_updated)
-            VALUES (%s, %s, 'Pending', NOW())
-            ON CONFLICT (user_id) DO UPDATE SET
-                username = EXCLUDED.username,
-                last_updated = NOW();
-        """, (user_id, username))
-        conn.commit()
+        async with _connection(conn) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO members (user_id, username, submission_status, last_updated)
+                    VALUES (%s, %s, 'Pending', NOW())
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = EXCLUDED.username,
+                        last_updated = NOW();
+                """, (user_id, username))
+        invalidate_members_cache()
         return True
     except Exception as e:
         logging.error(f"Error in add_member: {e}")
         return False
-    finally:
-        conn.close()
 
-def fetch_member(user_id: int):
-    conn = get_db_connection()
-    if conn is None:
-        return None
-    try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM members WHERE user_id = %s", (user_id,))
-        return cur.fetchone()
-    except Exception as e:
-        logging.error(f"Error fetch_member: {e}")
-        return None
-    finally:
-        conn.close()
-
-def update_submission_status(user_id: int, status: str):
+async def update_submission_status(user_id: int, status: str, conn=None):
     """
     Generic update: sets submission_status and last_updated.
     Use mark_completed() for Completed status (handles points/streak).
     """
-    conn = get_db_connection()
-    if conn is None:
-        return False
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE members SET submission_status = %s, last_updated = NOW()
-            WHERE user_id = %s;
-        """, (status, user_id))
-        conn.commit()
+        async with _connection(conn) as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    UPDATE members SET submission_status = %s, last_updated = NOW()
+                    WHERE user_id = %s;
+                """, (status, user_id))
+        # status moved away from Completed, so the next completion must hit the DB again
+        _COMPLETED_TODAY.pop(user_id, None)
+        invalidate_members_cache()
         return True
     except Exception as e:
         logging.error(f"Error update_submission_status: {e}")
         return False
-    finally:
-        conn.close()
 
-def mark_completed(user_id: int):
+async def mark_completed(user_id: int, username: str, today: date = None):
     """
     Called when user completes today's target.
     Logic:
@@ -160,94 +205,101 @@ def mark_completed(user_id: int):
       - target_count +=1
       - update last_completed_date to today
       - set submission_status to 'Completed'
+    All of the above is computed server-side in a single UPSERT, which also
+    creates the member row (or refreshes its username) so callers don't need add_member().
+    Returns the updated (points, streak) tuple, or None on failure.
+    Repeat completions on the same day are answered from _COMPLETED_TODAY without a DB trip.
+    Pass `today` (IST date) if the caller already has it, to skip another clock read.
+    Always runs in its own transaction (no conn=): the memo and cache bust must only
+    happen after the completion is committed.
     """
-    today = datetime.now(IST).date()
-    conn = get_db_connection()
-    if conn is None:
-        return False
+    if today is None:
+        today = datetime.now(IST).date()
+    memo = _COMPLETED_TODAY.get(user_id)
+    if memo and memo[0] == today:
+        return memo[1]
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT points, streak, last_completed_date FROM members WHERE user_id = %s", (user_id,))
-        row = cur.fetchone()
-        if not row:
-            # If the user isn't present, create and then mark
-            cur.execute("""
-                INSERT INTO members (user_id, username, submission_status, target_count, points, streak, last_completed_date, last_updated)
-                VALUES (%s, %s, 'Completed', 1, 10, 1, %s, NOW())
-                ON CONFLICT (user_id) DO NOTHING;
-            """, (user_id, "Unknown", today))
-            conn.commit()
-            return True
-
-        existing_points = row['points'] or 0
-        existing_streak = row['streak'] or 0
-        last_date = row['last_completed_date']
-
-        # Prevent double awarding if already completed today
-        if last_date == today:
-            # still update status and last_updated
-            cur.execute("""
-                UPDATE members SET submission_status = 'Completed', last_updated = NOW()
-                WHERE user_id = %s;
-            """, (user_id,))
-            conn.commit()
-            return True
-
-        # Determine streak
-        yesterday = today - timedelta(days=1)
-        bonus = 0
-        if last_date == yesterday:
-            new_streak = existing_streak + 1
-            bonus = 5  # streak bonus
-        else:
-            new_streak = 1
-
-        points_awarded = 10 + bonus
-        new_points = existing_points + points_awarded
-
-        cur.execute("""
-            UPDATE members
-            SET submission_status = 'Completed',
-                target_count = target_count + 1,
-                points = %s,
-                streak = %s,
-                last_completed_date = %s,
-                last_updated = NOW()
-            WHERE user_id = %s;
-        """, (new_points, new_streak, today, user_id))
-        conn.commit()
-        return True
+        async with _POOL.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    INSERT INTO members (user_id, username, submission_status, target_count, points, streak, last_completed_date, last_updated)
+                    VALUES (%(user_id)s, %(username)s, 'Completed', 1, 10, 1, %(today)s, NOW())
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = EXCLUDED.username,
+                        submission_status = 'Completed',
+                        target_count = members.target_count + CASE
+                            WHEN members.last_completed_date = %(today)s THEN 0
+                            ELSE 1 END,
+                        streak = CASE
+                            WHEN members.last_completed_date = %(today)s THEN members.streak
+                            WHEN members.last_completed_date = %(today)s::date - 1 THEN COALESCE(members.streak, 0) + 1
+                            ELSE 1 END,
+                        points = COALESCE(members.points, 0) + CASE
+                            WHEN members.last_completed_date = %(today)s THEN 0
+                            WHEN members.last_completed_date = %(today)s::date - 1 THEN 15
+                            ELSE 10 END,
+                        last_completed_date = %(today)s,
+                        last_updated = NOW()
+                    RETURNING points, streak;
+                """, {"user_id": user_id, "username": username, "today": today})
+                row = await cur.fetchone()
+        invalidate_members_cache()
+        if row:
+            _COMPLETED_TODAY[user_id] = (today, row)
+        return row
     except Exception as e:
         logging.error(f"Error mark_completed: {e}")
-        return False
-    finally:
-        conn.close()
+        return None
 
-def get_all_members(order_by_points=True):
+async def get_all_members(limit: int = 50):
     """
-    Fetch all members with necessary fields.
+    Fetch the top `limit` members with necessary fields (what the leaderboard shows).
+    Returns (rows, has_more): one extra row is fetched so has_more says whether
+    anyone was cut, without counting the whole table.
     Default ordering: points DESC, streak DESC, username ASC
+    Results are cached for _CACHE_TTL seconds; writes invalidate the cache.
     """
-    conn = get_db_connection()
-    if conn is None:
-        return []
+    if (_MEMBERS_CACHE["data"] is not None and _MEMBERS_CACHE["limit"] == limit
+            and monotonic() - _MEMBERS_CACHE["ts"] < _CACHE_TTL):
+        return _MEMBERS_CACHE["data"]
+    gen = _MEMBERS_CACHE["gen"]
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("""
-            SELECT user_id, username, submission_status, target_count, points, streak, last_completed_date
-            FROM members
-        """)
-        rows = cur.fetchall()
-        # Sort in Python so we control tie-breaks exactly
-        rows_sorted = sorted(rows, key=lambda r: ((r['points'] or 0), (r['streak'] or 0)), reverse=True)
-        return rows_sorted
+        async with _POOL.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute("""
+                    SELECT user_id, username, submission_status, target_count, points, streak, last_completed_date
+                    FROM members
+                    ORDER BY points DESC NULLS LAST, streak DESC NULLS LAST, username ASC
+                    LIMIT %s
+                """, (limit + 1,))
+                rows = await cur.fetchall()
+        result = (rows[:limit], len(rows) > limit)
+        # only cache if no write was invalidated while this query was in flight
+        if _MEMBERS_CACHE["gen"] == gen:
+            _MEMBERS_CACHE["data"] = result
+            _MEMBERS_CACHE["limit"] = limit
+            _MEMBERS_CACHE["ts"] = monotonic()
+        return result
     except Exception as e:
         logging.error(f"Error get_all_members: {e}")
+        return [], False
+
+async def get_pending_usernames():
+    """Usernames of every member not yet 'Completed' today (for the evening reminder)."""
+    try:
+        async with _POOL.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("""
+                    SELECT COALESCE(NULLIF(username, ''), user_id::text)
+                    FROM members
+                    WHERE submission_status IS DISTINCT FROM 'Completed'
+                """)
+                return [r[0] for r in await cur.fetchall()]
+    except Exception as e:
+        logging.error(f"Error get_pending_usernames: {e}")
         return []
-    finally:
-        conn.close()
 
-def apply_missed_deductions_and_reset():
+async def apply_missed_deductions_and_reset():
     """
     For members who are not 'Completed' for TODAY:
      - subtract 5 points (min 0)
@@ -256,72 +308,144 @@ def apply_missed_deductions_and_reset():
     Returns tuple (missed_usernames_list, updated_count)
     """
     today = datetime.now(IST).date()
-    conn = get_db_connection()
-    if conn is None:
-        return [], 0
     try:
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        # fetch all members
-        cur.execute("SELECT user_id, username, submission_status, points FROM members")
-        rows = cur.fetchall()
-        missed = []
-        updated = 0
-        for r in rows:
-            uid = r['user_id']
-            uname = r['username']
-            status = r['submission_status']
-            pts = r['points'] or 0
-            # If they haven't completed today (status not Completed OR last_completed_date != today)
-            cur2 = conn.cursor(cursor_factory=RealDictCursor)
-            cur2.execute("SELECT last_completed_date FROM members WHERE user_id = %s", (uid,))
-            ld = cur2.fetchone()
-            last_completed_date = ld['last_completed_date'] if ld else None
-            completed_today = (last_completed_date == today)
-            if not completed_today:
-                # apply deduction and reset streak
-                new_points = max(0, pts - 5)
-                cur.execute("""
+        async with _POOL.connection() as conn:
+            async with conn.cursor() as cur:
+                # One set-based UPDATE for everyone who hasn't completed today
+                await cur.execute("""
                     UPDATE members
-                    SET points = %s, streak = 0, submission_status = 'Missed', last_updated = NOW()
-                    WHERE user_id = %s;
-                """, (new_points, uid))
-                missed.append(uname if uname else str(uid))
-                updated += 1
-        conn.commit()
+                    SET points = GREATEST(0, COALESCE(points, 0) - 5), streak = 0,
+                        submission_status = 'Missed', last_updated = NOW()
+                    WHERE last_completed_date IS DISTINCT FROM %s
+                    RETURNING COALESCE(NULLIF(username, ''), user_id::text) AS name;
+                """, (today,))
+                missed = [name for (name,) in await cur.fetchall()]
+                updated = len(missed)
+        invalidate_members_cache()
         return missed, updated
     except Exception as e:
         logging.error(f"Error apply_missed_deductions_and_reset: {e}")
         return [], 0
-    finally:
-        conn.close()
+
+async def bulk_update_missed(conn, rows):
+    """
+    Bulk "missed" penalty for many members at once: deduct delta points (min 0),
+    reset streak and set submission_status to 'Missed', like
+    apply_missed_deductions_and_reset() but with a per-member delta.
+    rows: iterable of (user_id, delta) tuples. Streams them into a temp table
+    with COPY, then applies one UPDATE ... FROM join. Runs inside the caller's
+    transaction on `conn`; returns the number of members updated.
+    Penalized members are dropped from _COMPLETED_TODAY, so their next /done
+    writes to the DB again. Does NOT touch the members cache: the caller must
+    call invalidate_members_cache() after committing (_handler_tx() does this).
+    """
+    async with conn.cursor() as cur:
+        await cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS missed_staging (user_id BIGINT, delta INT) ON COMMIT DELETE ROWS;
+        """)
+        async with cur.copy("COPY missed_staging (user_id, delta) FROM STDIN") as copy:
+            for row in rows:
+                await copy.write_row(row)
+        await cur.execute("""
+            UPDATE members AS m
+            SET points = GREATEST(0, COALESCE(m.points, 0) - v.delta), streak = 0,
+                submission_status = 'Missed', last_updated = NOW()
+            FROM missed_staging AS v
+            WHERE m.user_id = v.user_id
+            RETURNING m.user_id;
+        """)
+        penalized = [uid for (uid,) in await cur.fetchall()]
+    # dropping a memo early is safe even if the caller rolls back: it only costs one DB trip
+    for uid in penalized:
+        _COMPLETED_TODAY.pop(uid, None)
+    return len(penalized)
 
 # ------------------------
 # 5. Telegram handlers
 # ------------------------
+# Shown on /status and the leaderboard when members were cut by get_all_members()'s limit
+MORE_MEMBERS_LINE = "…and more members\n"
+
+# Telegram rejects messages over 4096 characters (counted in UTF-16 code units)
+TELEGRAM_MAX_MESSAGE_LEN = 4096
+
+def _utf16_len(text):
+    return len(text.encode("utf-16-le")) // 2
+
+def split_message(text, limit=TELEGRAM_MAX_MESSAGE_LEN):
+    """
+    Split text into chunks of at most `limit` UTF-16 units, breaking on line
+    boundaries so HTML tags (always opened/closed on one line here) stay intact.
+    A single over-long line (e.g. a long mention list) is cut at the last ", "
+    that fits, or hard-cut as a last resort (never inside an HTML entity).
+    """
+    chunks, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while _utf16_len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = limit
+            while _utf16_len(line[:cut]) > limit:
+                cut -= 1
+            sep = line.rfind(", ", 0, cut - 1)
+            if sep > 0:
+                cut = sep + 2
+            else:
+                amp = line.rfind("&", 0, cut)
+                if amp > 0 and ";" not in line[amp:cut]:
+                    cut = amp
+            chunks.append(line[:cut])
+            line = line[cut:]
+        if _utf16_len(current) + _utf16_len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+async def send_group_message(text, parse_mode=None):
+    """Send text to the group (and thread, if set), split into several messages if over Telegram's limit."""
+    for chunk in split_message(text):
+        send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": chunk}
+        if parse_mode:
+            send_kwargs["parse_mode"] = parse_mode
+        # If thread_id provided and non-zero, Telegram supports sending to a thread by specifying message_thread_id (only for forum supergroups)
+        if THREAD_ID:
+            send_kwargs["message_thread_id"] = THREAD_ID
+        await telegram_bot_app.bot.send_message(**send_kwargs)
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     username = user.username if user.username else user.first_name
-    add_member(user.id, username)
+    await add_member(user.id, username)
     await update.message.reply_html(
-        f"Hello {user.first_name}!\n\nMain aapka daily target tracker bot hoon.\n"
+        f"Hello {html.escape(user.first_name)}!\n\nMain aapka daily target tracker bot hoon.\n"
         f"Subah 5-9 AM: Initial plan bhejien (photo/caption optional)\n"
         f"Raat 9-11 PM: Proof bhejien with caption 'today target completed' or use /done.\n"
         f"Use /status to view leaderboard and /done to mark completion."
     )
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    members = get_all_members()
+    members, has_more = await get_all_members()
     if not members:
         await update.message.reply_text("Abhi tak koi member register nahi hua hai.")
         return
-    response = "🎯 **Target Tracking Status (Live)** 🎯\n\n"
+    parts = ["🎯 <b>Target Tracking Status (Live)</b> 🎯\n\n"]
     for idx, m in enumerate(members, start=1):
         username = m['username'] or str(m['user_id'])
         status = m['submission_status'] or "Pending"
         pts = m['points'] or 0
         streak = m['streak'] or 0
-        response += f"{idx}. @{username} — {pts} pts | 🔥 Streak: {streak} | {status}\n"
-    await update.message.reply_text(response, parse_mode='Markdown') # Added parse_mode
+        parts.append(f"{idx}. @{html.escape(username)} — {pts} pts | 🔥 Streak: {streak} | {html.escape(status)}\n")
+    if has_more:
+        parts.append(MORE_MEMBERS_LINE)
+    response = "".join(parts)
+    # HTML (with escaped usernames) so '_', '*' or '[' in a name can't break parsing;
+    # split so a long list can't exceed Telegram's message limit
+    for chunk in split_message(response):
+        await update.message.reply_text(chunk, parse_mode='HTML')
 
 async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Mark user as done via /done command (usable in group)."""
@@ -329,15 +453,12 @@ async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     user_id = user.id
     username = user.username if user.username else user.first_name
 
-    # ensure member exists
-    add_member(user_id, username)
-
-    success = mark_completed(user_id)
-    if success:
-        # fetch new points & streak to show in the reply
-        member = fetch_member(user_id)
-        pts = member['points'] or 0
-        streak = member['streak'] or 0
+    # registers the member and returns new points & streak in one UPSERT
+    member = await mark_completed(user_id, username)
+    if member:
+        pts, streak = member
+        pts = pts or 0
+        streak = streak or 0
         await update.message.reply_text(f"🔥 Nice! @{username} marked as Completed. +10 pts {'+5 streak bonus' if streak>1 else ''}\nTotal: {pts} pts | 🔥 Streak: {streak} days")
     else:
         await update.message.reply_text("Kuch gadbad ho gayi. Dobara try karo.")
@@ -351,28 +472,40 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
     if update.effective_chat.id != GROUP_CHAT_ID:
         return
 
-    current_time = datetime.now(IST).time()
-    add_member(user_id, username)
+    now = datetime.now(IST)
+    current_time = now.time()
+
+    is_morning = _MORNING[0] <= current_time <= _MORNING[1]
+    is_night = _NIGHT[0] <= current_time <= _NIGHT[1]
 
-    morning_start = time(5, 0)
-    morning_end = time(9, 0)
-    night_start = time(21, 0)
-    night_end = time(23, 0)
+    caption = update.message.caption or ""
+    is_proof = is_night and _DONE_RE.search(caption) is not None
 
-    is_morning = morning_start <= current_time <= morning_end
-    is_night = night_start <= current_time <= night_end
+    # proof submissions register the member inside mark_completed()'s UPSERT,
+    # morning plans register it in the same transaction as the status update
+    if not is_proof and not is_morning:
+        await add_member(user_id, username)
 
     if is_morning:
-        update_submission_status(user_id, "Planned")
-        await update.message.reply_text("✅ Target Plan Received! Status updated to 'Planned'.")
+        # pool checkout / COMMIT happen outside the helpers' own try blocks, so guard them here
+        try:
+            async with _handler_tx() as conn:
+                ok = (await add_member(user_id, username, conn=conn)
+                      and await update_submission_status(user_id, "Planned", conn=conn))
+        except Exception as e:
+            logging.error(f"Error in handle_photo_message (morning plan): {e}")
+            ok = False
+        if ok:
+            await update.message.reply_text("✅ Target Plan Received! Status updated to 'Planned'.")
+        else:
+            await update.message.reply_text("Kuch gadbad ho gayi. Dobara try karo.")
     elif is_night:
-        caption = (update.message.caption or "").lower()
-        if 'today target completed' in caption or 'today target complete' in caption or 'target completed' in caption:
-            ok = mark_completed(user_id)
-            if ok:
-                member = fetch_member(user_id)
+        if is_proof:
+            member = await mark_completed(user_id, username, today=now.date())
+            if member:
+                pts, streak = member
                 await update.message.reply_text(
-                    f"🔥 Target proof received, @{username}! Status set to Completed. Total: {member['points']} pts | 🔥 Streak: {member['streak']} days"
+                    f"🔥 Target proof received, @{username}! Status set to Completed. Total: {pts} pts | 🔥 Streak: {streak} days"
                 )
             else:
                 await update.message.reply_text("Kuch error hua while marking completion. Try /done.")
@@ -390,8 +523,46 @@ async def handle_photo_message(update: Update, context: ContextTypes.DEFAULT_TYP
 # ------------------------
 # 6. Scheduler jobs (async wrappers)
 # ------------------------
-async def send_leaderboard_job():
-    """Sends full-members leaderboard at 11:01 PM IST (mixed Hindi-English tone)."""
+# Leaderboard line per submission_status (mixed Hindi-English)
+LEADERBOARD_LINE_FORMATS = {
+    'Completed': "#{idx} 🏆 @{uname} — {pts} pts | 🔥 Streak: {streak} days — Aaj ka kaam perfect! ✅\n",
+    'Missed': "#{idx} ⚠️ @{uname} — {pts} pts | 🔻 Streak reset — Aaj missed. Chal next time!\n",
+    'Planned': "#{idx} 🔜 @{uname} — {pts} pts | 🔁 Planned — Jaldi proof bhejo!\n",
+}
+LEADERBOARD_DEFAULT_LINE = "#{idx} ❗ @{uname} — {pts} pts | Streak: {streak} — Abhi pending.\n"
+
+def build_leaderboard_message(members, missed_list=None, has_more=False):
+    """
+    Build the leaderboard text for `members` (already sorted in SQL), as HTML
+    with escaped usernames. If missed_list is given, a missed-submissions
+    summary naming every penalized member is put in the header (callers send
+    via send_group_message(), which splits it if too long).
+    """
+    today_str = datetime.now(IST).strftime("%-d %b %Y")
+    parts = [f"🔥 <b>Vaibhav’s Inferno Tracker — Leaderboard ({today_str})</b> 🔥\n\n"]
+    if missed_list:
+        parts.append(f"⚠️ Missed submissions detected for {len(missed_list)} members — -5 pts and streak reset applied.\n")
+        parts.append(f"Missed: {', '.join(['@'+html.escape(m) for m in missed_list])}\n\n")
+    for idx, m in enumerate(members, start=1):
+        uname = m['username'] or str(m['user_id'])
+        pts = m['points'] or 0
+        streak = m['streak'] or 0
+        status = m['submission_status'] or "Pending"
+        fmt = LEADERBOARD_LINE_FORMATS.get(status, LEADERBOARD_DEFAULT_LINE)
+        parts.append(fmt.format(idx=idx, uname=html.escape(uname), pts=pts, streak=streak))
+
+    if has_more:
+        parts.append(MORE_MEMBERS_LINE)
+
+    parts.append("\n🏁 Keep pushing — kal fir se full josh! 💪\n(Leaderboard updates everyday 11:01 PM IST)")
+    return "".join(parts)
+
+async def send_leaderboard_job(missed_list=None):
+    """
+    Sends the top-50 leaderboard (mixed Hindi-English tone), with a "…and more members"
+    line when the group is bigger and, if given, the missed-submissions summary in the
+    header. Split into several messages if over Telegram's limit.
+    """
     global telegram_bot_app
     if not telegram_bot_app:
         logging.info("Bot app not ready — skipping leaderboard job.")
@@ -401,47 +572,21 @@ async def send_leaderboard_job():
         logging.error("GROUP_CHAT_ID not set. Cannot send leaderboard.")
         return
 
-    members = get_all_members()
+    members, has_more = await get_all_members()
     if not members:
-        await telegram_bot_app.bot.send_message(chat_id=GROUP_CHAT_ID, text="Leaderboard: koi member nahi mila.")
+        await send_group_message("Leaderboard: koi member nahi mila.")
         return
 
-    # Build message: full members list, sorted by points then streak (already sorted)
-    today_str = datetime.now(IST).strftime("%-d %b %Y")
-    header = f"🔥 **Vaibhav’s Inferno Tracker — Leaderboard ({today_str})** 🔥\n\n"
-    body = ""
-    for idx, m in enumerate(members, start=1):
-        uname = m['username'] or str(m['user_id'])
-        pts = m['points'] or 0
-        streak = m['streak'] or 0
-        status = m['submission_status'] or "Pending"
-        # Mixed Hindi-English line
-        if status == 'Completed':
-            line = f"#{idx} 🏆 @{uname} — {pts} pts | 🔥 Streak: {streak} days — Aaj ka kaam perfect! ✅\n"
-        elif status == 'Missed':
-            line = f"#{idx} ⚠️ @{uname} — {pts} pts | 🔻 Streak reset — Aaj missed. Chal next time!\n"
-        elif status == 'Planned':
-            line = f"#{idx} 🔜 @{uname} — {pts} pts | 🔁 Planned — Jaldi proof bhejo!\n"
-        else:
-            line = f"#{idx} ❗ @{uname} — {pts} pts | Streak: {streak} — Abhi pending.\n"
-        body += line
-
-    footer = "\n🏁 Keep pushing — kal fir se full josh! 💪\n(Leaderboard updates everyday 11:01 PM IST)"
-    final_msg = header + body + footer
-
-    # If thread_id provided and non-zero, Telegram supports sending to a thread by specifying message_thread_id (only for forum supergroups)
-    send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": final_msg, "parse_mode": "Markdown"}
-    if THREAD_ID:
-        send_kwargs["message_thread_id"] = THREAD_ID
-
-    await telegram_bot_app.bot.send_message(**send_kwargs)
+    final_msg = build_leaderboard_message(members, missed_list, has_more)
+    await send_group_message(final_msg, parse_mode="HTML")
     logging.info("Leaderboard sent.")
 
 async def nightly_process_job():
     """
-    At 23:05-ish we:
+    At 23:01 we:
      - apply missed deductions for those who didn't complete today
-     - then send leaderboard (so leaderboard reflects deductions)
+     - then send missed summary + leaderboard together (so leaderboard reflects deductions),
+       as one message when it fits in Telegram's limit
     """
     global telegram_bot_app
     if not telegram_bot_app:
@@ -452,19 +597,10 @@ async def nightly_process_job():
         logging.error("GROUP_CHAT_ID not set. Cannot run nightly process.")
         return
 
-    # Apply missed deductions & reset streak for missed users
-    missed_list, updated = apply_missed_deductions_and_reset()
-    if missed_list:
-        # Notify group about deductions (short message)
-        text = f"⚠️ Missed submissions detected for {len(missed_list)} members — -5 pts and streak reset applied.\nPending: {', '.join(['@'+m for m in missed_list])}"
-        send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": text}
-        if THREAD_ID:
-            send_kwargs["message_thread_id"] = THREAD_ID
-        await telegram_bot_app.bot.send_message(**send_kwargs)
-
-    # Small delay then send leaderboard
-    await asyncio.sleep(1)
-    await send_leaderboard_job()
+    # Apply missed deductions & reset streak for missed users (this also busts the members cache)
+    missed_list, updated = await apply_missed_deductions_and_reset()
+    logging.info(f"Nightly deductions applied ({updated} missed).")
+    await send_leaderboard_job(missed_list)
 
 async def reset_daily_status_job():
     """At 00:00 AM IST — reset everyone's submission_status to 'Pending' for the new day."""
@@ -477,22 +613,24 @@ async def reset_daily_status_job():
         logging.error("GROUP_CHAT_ID not set. Cannot send daily reset message.")
         return
 
-    conn = get_db_connection()
-    if conn is None:
-        return
     try:
-        cur = conn.cursor()
-        cur.execute("UPDATE members SET submission_status = 'Pending', last_updated = NOW()")
-        conn.commit()
-        txt = "⏰ **Daily Reset!** Sabka status ab 'Pending' par set kar diya gaya hai. Naye targets bhejne shuru karo! 🎯"
-        send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": txt, "parse_mode": "Markdown"}
+        async with _POOL.connection() as conn:
+            async with conn.cursor() as cur:
+                # Skip rows already Pending so they aren't rewritten (less WAL / dead tuples)
+                await cur.execute("""
+                    UPDATE members SET submission_status = 'Pending', last_updated = NOW()
+                    WHERE submission_status IS DISTINCT FROM 'Pending'
+                """)
+                reset_count = cur.rowcount
+        invalidate_members_cache()
+        _COMPLETED_TODAY.clear()
+        txt = f"⏰ <b>Daily Reset!</b> Sabka status ab 'Pending' par set kar diya gaya hai ({reset_count} members reset). Naye targets bhejne shuru karo! 🎯"
+        send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": txt, "parse_mode": "HTML"}
         if THREAD_ID:
             send_kwargs["message_thread_id"] = THREAD_ID
         await telegram_bot_app.bot.send_message(**send_kwargs)
     except Exception as e:
         logging.error(f"Error in reset_daily_status_job: {e}")
-    finally:
-        conn.close()
 
 async def evening_reminder_job():
     """9:30 PM IST reminder for pending users."""
@@ -505,18 +643,48 @@ async def evening_reminder_job():
         logging.error("GROUP_CHAT_ID not set. Cannot send reminder.")
         return
 
-    members = get_all_members()
-    pending = [f"@{m['username']}" for m in members if m['submission_status'] != 'Completed']
+    pending = [f"@{html.escape(u)}" for u in await get_pending_usernames()]
     if pending:
-        text = "🔔 **Target Reminder!** 🔔\nAaj raat proof bhejna na bhoolo!\nPending: " + ", ".join(pending)
-        send_kwargs = {"chat_id": GROUP_CHAT_ID, "text": text, "parse_mode": "Markdown"}
-        if THREAD_ID:
-            send_kwargs["message_thread_id"] = THREAD_ID
-        await telegram_bot_app.bot.send_message(**send_kwargs)
+        text = "🔔 <b>Target Reminder!</b> 🔔\nAaj raat proof bhejna na bhoolo!\nPending: " + ", ".join(pending)
+        await send_group_message(text, parse_mode="HTML")
 
 # ------------------------
 # 7. Main app and scheduler
 # ------------------------
+def start_scheduler():
+    """
+    Start the AsyncIOScheduler. Must be called from inside the running event loop
+    (post_init), so the cron jobs are awaited on the same loop as the bot.
+    """
+    global _SCHEDULER
+    _SCHEDULER = AsyncIOScheduler(timezone=IST) # Use IST timezone for cron jobs
+
+    # 1) Evening reminder: 21:30 IST
+    _SCHEDULER.add_job(evening_reminder_job, "cron", hour=21, minute=30, id="evening_reminder")
+
+    # 2) Nightly process (deduction + leaderboard): 23:01 IST
+    _SCHEDULER.add_job(nightly_process_job, "cron", hour=23, minute=1, id="nightly_process")
+
+    # 3) Daily reset at 00:00 IST
+    _SCHEDULER.add_job(reset_daily_status_job, "cron", hour=0, minute=0, id="daily_reset")
+
+    _SCHEDULER.start()
+    logging.info("Scheduler (AsyncIOScheduler) started with jobs: evening_reminder (21:30), nightly_process (23:01), daily_reset (00:00).")
+
+async def on_startup(application: Application) -> None:
+    """post_init hook: open the DB pool, ensure schema and start the scheduler on the bot's running event loop."""
+    # DB setup (pool first, so every helper reuses the same connections)
+    if not await init_db_pool():
+        raise RuntimeError("Could not open DB connection pool.")
+    await setup_database()
+    start_scheduler()
+
+async def on_shutdown(application: Application) -> None:
+    """post_shutdown hook: stop the scheduler and release pooled DB connections."""
+    if _SCHEDULER is not None and _SCHEDULER.running:
+        _SCHEDULER.shutdown(wait=False)
+    await close_db_pool()
+
 def main():
     global telegram_bot_app
 
@@ -529,12 +697,23 @@ def main():
         logging.error("Missing WEBHOOK_URL environment variable (required for Webhook mode on Render). Exiting.")
         return
 
-    # DB setup
-    setup_database()
-
     # Application setup
     # Note: run_webhook automatically sets the necessary updates
-    application = Application.builder().token(BOT_TOKEN).build()
+    # DB pool and scheduler are loop-bound, so they are started/stopped via post_init/post_shutdown
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        # Queue outbound sends under Telegram's flood limits (30 msg/s overall, 20 msg/min per group);
+        # max_retries makes the limiter wait out a RetryAfter instead of raising it to the handler
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=28, overall_time_period=1,
+            group_max_rate=18, group_time_period=60,
+            max_retries=3
+        ))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     telegram_bot_app = application  # set global for jobs
 
     # Handlers
@@ -543,21 +722,6 @@ def main():
     application.add_handler(CommandHandler("done", done_command))
     application.add_handler(MessageHandler(filters.PHOTO & filters.Chat(GROUP_CHAT_ID), handle_photo_message))
 
-    # Scheduler (AsyncIOScheduler) - needed because run_webhook uses asyncio
-    scheduler = AsyncIOScheduler(timezone=IST) # Use IST timezone for cron jobs
-
-    # 1) Evening reminder: 21:30 IST
-    scheduler.add_job(evening_reminder_job, "cron", hour=21, minute=30, id="evening_reminder")
-
-    # 2) Nightly process (deduction + leaderboard): 23:01 IST
-    scheduler.add_job(nightly_process_job, "cron", hour=23, minute=1, id="nightly_process")
-
-    # 3) Daily reset at 00:00 IST
-    scheduler.add_job(reset_daily_status_job, "cron", hour=0, minute=0, id="daily_reset")
-
-    scheduler.start()
-    logging.info("Scheduler (AsyncIOScheduler) started with jobs: evening_reminder (21:30), nightly_process (23:01), daily_reset (00:00).")
-
     # Run bot in Webhook mode, binding to the port specified by Render
     logging.info(f"Bot starting Webhook on port {PORT} with URL {WEBHOOK_URL}...")
     